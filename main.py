@@ -1,23 +1,37 @@
 import sounddevice as sd
 import numpy as np
-import wave
+import soundfile as sf
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import os
 from pretrained_detector import PretrainedGunshotDetector
 import math
+import queue
 import sys
+import threading
+import time
+
+# Numba is optional; without it calculate_db uses a NumPy dot-product reduction
+try:
+    from numba import njit
+except ImportError:
+    njit = None
 
 # Configuration
 SAMPLE_RATE = 44100
-DURATION = 5
+DURATION = 5  # Seconds of audio kept for saved recordings
+WINDOW_SECONDS = 0.96  # Detection window (one YAMNet frame)
+HOP_SECONDS = 0.48  # Time between detections (50% overlap)
 CHANNELS = 1
 SAVE_PATH = "recordings/"
+MAX_PENDING_SAVES = 4  # Recordings queued for writing before save_audio blocks
 
 # VU meter configuration
 METER_WIDTH = 40  # Width of the console meter
 DB_MIN = -60  # Minimum dB to show
 DB_MAX = 0    # Maximum dB to show
+METER_REFRESH = 0.05  # Seconds between VU meter redraws
 
 # ASCII characters for the meter (Windows-compatible)
 METER_CHARS = {
@@ -26,22 +40,81 @@ METER_CHARS = {
     'peak': '|'
 }
 
+# Pre-rendered meter bars, one per level (0..METER_WIDTH)
+_METER_STRINGS = [
+    METER_CHARS['full'] * i + METER_CHARS['empty'] * (METER_WIDTH - i)
+    for i in range(METER_WIDTH + 1)
+]
+
+# Color codes per level band (Windows consoles get no colors)
+if sys.platform == 'win32':
+    _METER_HIGH = _METER_MEDIUM = _METER_LOW = _METER_RESET = ''
+else:
+    _METER_HIGH = '\033[91m'    # red
+    _METER_MEDIUM = '\033[93m'  # yellow
+    _METER_LOW = '\033[92m'     # green
+    _METER_RESET = '\033[0m'
+
+if njit is not None:
+    @njit(cache=True, fastmath=True, boundscheck=False)
+    def _rms_db(audio_data, db_min, db_max):
+        """Clamped RMS level in dB, computed in a single fused loop."""
+        sum_sq = 0.0
+        for sample in audio_data:
+            sum_sq += sample * sample
+        if sum_sq <= 0.0:
+            return db_min
+        db = 10.0 * math.log10(sum_sq / audio_data.size)
+        return min(max(db, db_min), db_max)
+else:
+    _rms_db = None
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class AudioRecorder:
+    # Fixed attribute set: slot access is cheaper in the audio callback
+    __slots__ = (
+        'stream', 'is_recording', 'current_db',
+        '_pcm', '_pcm_lock', '_write_idx', '_samples_written', '_data_ready',
+        '_save_executor', '_pending_saves',
+        '_ui_thread', '_last_meter_level',
+        '_input_device', '_db_min', '_db_max', '_db_range', '_meter_width', '_meter_peak',
+    )
+    
     def __init__(self):
         self.stream = None
-        self.audio_buffer = []
         self.is_recording = False
+        
+        # Configuration bound once so hot paths avoid global and dict lookups
+        self._db_min = float(DB_MIN)
+        self._db_max = float(DB_MAX)
+        self._db_range = float(DB_MAX - DB_MIN)
+        self._meter_width = METER_WIDTH
+        self._meter_peak = METER_CHARS['peak']
+        
+        # Preallocated ring buffer holding the last DURATION seconds of audio
+        self._pcm = np.zeros(int(SAMPLE_RATE * DURATION), dtype=np.float32)
+        # Guards ring writes and cursor updates against concurrent snapshots
+        self._pcm_lock = threading.Lock()
+        self._write_idx = 0
+        self._samples_written = 0
+        self._data_ready = threading.Event()
+        
+        # Recordings are written on a single background thread
+        self._save_executor = ThreadPoolExecutor(max_workers=1)
+        self._pending_saves = threading.BoundedSemaphore(MAX_PENDING_SAVES)
+        
         self.current_db = DB_MIN
+        self._ui_thread = None
+        self._last_meter_level = None
         
         # Check available devices and select default
         try:
             devices = sd.query_devices()
-            input_device = sd.default.device[0]
-            device_info = sd.query_devices(input_device, 'input')
+            self._input_device = sd.default.device[0]
+            device_info = sd.query_devices(self._input_device, 'input')
             logger.info(f"Using input device: {device_info['name']}")
             
             if device_info['default_samplerate'] != SAMPLE_RATE:
@@ -52,51 +125,58 @@ class AudioRecorder:
         except Exception as e:
             logger.error(f"Error querying audio devices: {str(e)}")
             raise RuntimeError("Failed to initialize audio device")
+        
+        # Compile the JIT dB kernel now (for the callback's channel view)
+        # rather than on the first audio block
+        if _rms_db is not None:
+            warmup = np.zeros((int(SAMPLE_RATE * 0.1), CHANNELS), dtype=np.float32)
+            self.calculate_db(warmup[:, 0])
 
     def calculate_db(self, audio_data):
         """Calculate decibel level from audio data."""
-        if len(audio_data) == 0:
-            return DB_MIN
+        db_min = self._db_min
+        if audio_data.size == 0:
+            return db_min
+        
+        if _rms_db is not None:
+            return _rms_db(audio_data, db_min, self._db_max)
         
-        # Calculate RMS value
-        rms = np.sqrt(np.mean(np.square(audio_data)))
+        # Sum of squares in a single BLAS pass (no squared temporary)
+        sum_sq = float(np.dot(audio_data, audio_data))
+        if sum_sq <= 0:
+            return db_min
         
-        # Convert to decibels
-        if rms > 0:
-            db = 20 * math.log10(rms)
-        else:
-            db = DB_MIN
+        # 20*log10(sqrt(mean_sq)) == 10*log10(mean_sq), so skip the sqrt
+        db = 10.0 * math.log10(sum_sq / audio_data.size)
             
         # Clamp the value
-        return max(min(db, DB_MAX), DB_MIN)
+        return max(min(db, self._db_max), db_min)
 
     def draw_vu_meter(self, db):
         """Draw a VU meter in the console using ASCII characters."""
         # Normalize db value to 0-1 range
-        normalized = (db - DB_MIN) / (DB_MAX - DB_MIN)
-        meter_level = int(normalized * METER_WIDTH)
-        
-        # Create meter segments using ASCII characters
-        meter = (METER_CHARS['full'] * meter_level + 
-                METER_CHARS['empty'] * (METER_WIDTH - meter_level))
-        
-        # Create the scale with ASCII characters
-        scale = f"{db:>6.1f} dB {METER_CHARS['peak']}{meter}{METER_CHARS['peak']} {DB_MAX}"
-        
-        # Use Windows-compatible color codes
-        if sys.platform == 'win32':
-            # On Windows, we'll just print without colors
-            print(f"{scale}", end='\r')
-        else:
-            # On Unix-like systems, we can use colors
-            if db > -10:  # High level - red
-                print(f"\033[91m{scale}\033[0m", end='\r')
-            elif db > -20:  # Medium level - yellow
-                print(f"\033[93m{scale}\033[0m", end='\r')
-            else:  # Low level - green
-                print(f"\033[92m{scale}\033[0m", end='\r')
-        
-        sys.stdout.flush()  # Ensure the output is displayed immediately
+        normalized = (db - self._db_min) / self._db_range
+        meter_level = int(normalized * self._meter_width)
+        
+        # Nothing to redraw if the bar hasn't moved
+        if meter_level == self._last_meter_level:
+            return
+        self._last_meter_level = meter_level
+        
+        if db > -10:  # High level - red
+            color = _METER_HIGH
+        elif db > -20:  # Medium level - yellow
+            color = _METER_MEDIUM
+        else:  # Low level - green
+            color = _METER_LOW
+        
+        peak = self._meter_peak
+        line = '%s%6.1f dB %s%s%s %d%s\r' % (
+            color, db, peak, _METER_STRINGS[meter_level], peak, self._db_max, _METER_RESET)
+        
+        # Plain write works with any stdout replacement (IDEs, capture, notebooks)
+        sys.stdout.write(line)
+        sys.stdout.flush()
     
     def _initialize_stream(self):
         """Initialize the audio stream with error handling."""
@@ -108,9 +188,10 @@ class AudioRecorder:
             self.stream = sd.InputStream(
                 samplerate=SAMPLE_RATE,
                 channels=CHANNELS,
+                dtype='float32',
                 callback=self._audio_callback,
                 blocksize=int(SAMPLE_RATE * 0.1),  # 100ms blocks
-                device=sd.default.device[0]
+                device=self._input_device
             )
             return True
         except Exception as e:
@@ -121,15 +202,53 @@ class AudioRecorder:
         if status:
             logger.warning(f"Status: {status}")
         if self.is_recording:
-            self.audio_buffer.extend(indata.copy())
-            # Calculate and display current decibel level
-            self.current_db = self.calculate_db(indata)
+            # Copy the first channel into the ring buffer, wrapping at the end.
+            # sounddevice reuses indata, so this is the one copy into owned memory.
+            pcm = self._pcm
+            samples = indata[:, 0]
+            with self._pcm_lock:
+                start = self._write_idx
+                end = start + frames
+                size = len(pcm)
+                if end <= size:
+                    np.copyto(pcm[start:end], samples)
+                else:
+                    split = size - start
+                    np.copyto(pcm[start:], samples[:split])
+                    np.copyto(pcm[:end - size], samples[split:])
+                self._write_idx = end % size
+                self._samples_written += frames
+            # Only publish the level here; drawing happens on the UI thread
+            self.current_db = self.calculate_db(samples)
+            self._data_ready.set()
+    
+    def _ui_loop(self):
+        """Redraw the VU meter from the latest dB value while recording."""
+        while self.is_recording:
             self.draw_vu_meter(self.current_db)
+            time.sleep(METER_REFRESH)
             
-    def record(self, duration):
-        """Record audio with improved error handling."""
-        self.audio_buffer = []
+    def latest(self, num_samples):
+        """Return a copy of the most recent num_samples of audio, oldest first."""
+        # Hold the lock so the callback can't overwrite the region mid-copy
+        with self._pcm_lock:
+            end = self._write_idx
+            start = end - num_samples
+            if start >= 0:
+                return self._pcm[start:end].copy()
+            return np.concatenate((self._pcm[start:], self._pcm[:end]))
+    
+    def stream_windows(self, window_seconds, hop_seconds):
+        """Record continuously, yielding the latest window every hop."""
+        window = int(SAMPLE_RATE * window_seconds)
+        hop = int(SAMPLE_RATE * hop_seconds)
+        
         self.is_recording = False
+        self._pcm.fill(0)
+        self._write_idx = 0
+        self._samples_written = 0
+        self._last_meter_level = None
+        self._data_ready.clear()
         
         # Initialize stream
         if not self._initialize_stream():
@@ -141,28 +260,97 @@ class AudioRecorder:
                 logger.debug("Recording started...")
                 print("\nRecording... (Press Ctrl+C to stop)")
                 print("VU Meter:")
-                sd.sleep(int(duration * 1000))
+                self._ui_thread = threading.Thread(target=self._ui_loop, daemon=True)
+                self._ui_thread.start()
+                
+                next_window = window
+                while True:
+                    # Timeout keeps Ctrl+C responsive while waiting for audio
+                    if not self._data_ready.wait(timeout=0.5):
+                        # A stopped stream (e.g. device unplugged) never delivers more
+                        # audio; raise so the caller can reinitialize it
+                        if not self.stream.active:
+                            raise RuntimeError("Audio stream stopped unexpectedly")
+                        continue
+                    self._data_ready.clear()
+                    
+                    if self._samples_written >= next_window:
+                        # Windows missed while the consumer was busy are skipped
+                        next_window = self._samples_written + hop
+                        yield self.latest(window)
         except Exception as e:
             logger.error(f"Error during recording: {str(e)}")
             raise
         finally:
             self.is_recording = False
+            if self._ui_thread is not None:
+                self._ui_thread.join()
+                self._ui_thread = None
             if self.stream is not None and self.stream.active:
                 self.stream.stop()
                 self.stream.close()
             print()  # New line after VU meter
         
-        return np.array(self.audio_buffer)
-        
     def save_audio(self, audio_data, filename):
+        """Queue audio to be written in the background and return its path."""
         os.makedirs(SAVE_PATH, exist_ok=True)
         filepath = os.path.join(SAVE_PATH, filename)
-        with wave.open(filepath, 'wb') as wf:
-            wf.setnchannels(CHANNELS)
-            wf.setsampwidth(2)
-            wf.setframerate(SAMPLE_RATE)
-            wf.writeframes(audio_data.tobytes())
+        
+        # Blocks only if MAX_PENDING_SAVES writes are already waiting
+        self._pending_saves.acquire()
+        try:
+            # No copy: callers must not modify audio_data afterwards
+            # (latest() already returns a fresh array)
+            future = self._save_executor.submit(
+                self._save_audio_sync, np.asarray(audio_data, dtype=np.float32), filepath)
+        except Exception:
+            self._pending_saves.release()
+            raise
+        future.add_done_callback(self._save_done)
         return filepath
+    
+    def _save_audio_sync(self, audio_data, filepath):
+        # libsndfile converts the float32 samples to 16-bit PCM in one pass
+        sf.write(filepath, audio_data, SAMPLE_RATE, subtype='PCM_16')
+    
+    def _save_done(self, future):
+        self._pending_saves.release()
+        if future.cancelled():
+            logger.warning("\nRecording save was cancelled")
+        elif future.exception() is not None:
+            logger.error(f"\nError saving recording: {str(future.exception())}")
+
+def detection_worker(recorder, detector, windows):
+    """Run detection on queued windows so capture never waits on inference."""
+    last_saved = None  # time.monotonic() of the last saved detection
+    while True:
+        window = windows.get()
+        try:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Audio range: [{np.min(window)}, {np.max(window)}]")
+            
+            # Per-window results are logged at DEBUG so they don't scroll over the VU meter
+            probability = detector.detect(window, SAMPLE_RATE)
+            
+            # If probability exceeds threshold, save the last DURATION seconds
+            # Lower threshold for testing
+            if probability > 0.2:  # Even lower threshold for testing
+                # Overlapping windows see the same gunshot; the saved clip already
+                # covers the last DURATION seconds, so save once per DURATION
+                now = time.monotonic()
+                if last_saved is not None and now - last_saved < DURATION:
+                    logger.debug(f"Gunshot still in last saved clip (Probability: {probability:.3f})")
+                    continue
+                last_saved = now
+                
+                audio_data = recorder.latest(int(SAMPLE_RATE * DURATION))
+                # Millisecond timestamps keep filenames unique
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
+                filename = f"gunshot_{timestamp}.wav"
+                filepath = recorder.save_audio(audio_data, filename)
+                logger.info(f"\nGunshot detected! (Probability: {probability:.3f}) Saved to {filepath}")
+        except Exception as e:
+            logger.error(f"\nError in detection worker: {str(e)}")
 
 def main():
     try:
@@ -176,27 +364,24 @@ def main():
         logger.info("Starting gunshot detection system using pre-trained model...")
         print("\nMonitoring audio levels...")
         
+        # Detection runs on its own thread, fed through a small bounded queue
+        windows = queue.Queue(maxsize=2)
+        worker = threading.Thread(
+            target=detection_worker,
+            args=(recorder, detector, windows),
+            daemon=True
+        )
+        worker.start()
+        
         while True:
             try:
-                # Record audio
+                # Hand each sliding window to the detector as it becomes available
                 logger.debug("Recording audio...")
-                audio_data = recorder.record(DURATION)
-                
-                # Log audio statistics
-                logger.debug(f"Recorded audio shape: {audio_data.shape}")
-                logger.debug(f"Audio range: [{np.min(audio_data)}, {np.max(audio_data)}]")
-                
-                # Detect gunshots
-                probability = detector.detect(audio_data, SAMPLE_RATE)
-                print(f"\nGunshot probability: {probability:.3f}")
-                
-                # If probability exceeds threshold, save the audio
-                # Lower threshold for testing
-                if probability > 0.2:  # Even lower threshold for testing
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    filename = f"gunshot_{timestamp}.wav"
-                    filepath = recorder.save_audio(audio_data, filename)
-                    logger.info(f"\nGunshot detected! (Probability: {probability:.3f}) Saved to {filepath}")
+                for window in recorder.stream_windows(WINDOW_SECONDS, HOP_SECONDS):
+                    try:
+                        windows.put_nowait(window)
+                    except queue.Full:
+                        logger.debug("Detector busy, dropping window")
                     
             except Exception as e:
                 logger.error(f"\nError in recording loop: {str(e)}")
@@ -1,7 +1,7 @@
 # mic_test.py
 import sounddevice as sd
 import numpy as np
-import wave
+import soundfile as sf
 import logging
 from datetime import datetime
 import os
@@ -50,11 +50,7 @@ class MicrophoneTester:
             # Save recording
             os.makedirs("test_recordings", exist_ok=True)
             filepath = os.path.join("test_recordings", filename)
-            with wave.open(filepath, 'wb') as wf:
-                wf.setnchannels(channels)
-                wf.setsampwidth(2)  # 16-bit
-                wf.setframerate(sample_rate)
-                wf.writeframes((recording * 32767).astype(np.int16).tobytes())
+            sf.write(filepath, recording, sample_rate, subtype='PCM_16')
             
             logger.info(f"Recording saved to: {filepath}")
             logger.info(f"Recording shape: {recording.shape}")
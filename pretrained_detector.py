@@ -1,32 +1,58 @@
 import tensorflow as tf
 import tensorflow_hub as hub
 import numpy as np
-import librosa
+from scipy.signal import firwin, resample_poly
+import functools
 import logging
+import math
+import os
 import csv
-import io
 import requests
 
 logger = logging.getLogger(__name__)
 
+# YAMNet frame: 0.96 s at 16kHz
+YAMNET_FRAME_SAMPLES = 15360
+YAMNET_NUM_CLASSES = 521
+
+# Peak amplitude (about -34 dBFS) below which audio is treated as silence
+NOISE_FLOOR = 0.02
+
+# Quantized model produced by quantize_yamnet.py; used instead of TF-Hub when present
+TFLITE_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'yamnet_int8.tflite')
+
+CLASS_MAP_URL = 'https://raw.githubusercontent.com/tensorflow/models/master/research/audioset/yamnet/yamnet_class_map.csv'
+CLASS_MAP_CACHE = os.path.join(os.path.expanduser('~'), '.cache', 'gsd', 'yamnet_class_map.csv')
+
+@functools.lru_cache(maxsize=None)
+def _resample_filter(up, down):
+    """Design (once per ratio) the anti-aliasing filter resample_poly would use."""
+    max_rate = max(up, down)
+    return firwin(2 * 10 * max_rate + 1, 1.0 / max_rate, window=('kaiser', 5.0)).astype(np.float32)
+
 class PretrainedGunshotDetector:
     def __init__(self):
         logger.info("Loading YAMNet model...")
         try:
-            # Load the pre-trained YAMNet model
-            self.model = hub.load('https://tfhub.dev/google/yamnet/1')
-            logger.info("YAMNet model loaded successfully")
-            
-            # Load class names directly from GitHub
-            class_map_url = 'https://raw.githubusercontent.com/tensorflow/models/master/research/audioset/yamnet/yamnet_class_map.csv'
-            response = requests.get(class_map_url)
-            class_map_csv = io.StringIO(response.text)
-            
-            self.class_names = []
-            reader = csv.reader(class_map_csv)
-            next(reader)  # Skip header
-            for row in reader:
-                self.class_names.append(row[2])
+            self.model = None
+            self.interpreter = None
+            if os.path.exists(TFLITE_MODEL_PATH):
+                self._load_tflite(TFLITE_MODEL_PATH)
+            else:
+                # Load the pre-trained YAMNet model
+                self.model = hub.load('https://tfhub.dev/google/yamnet/1')
+                logger.info("YAMNet model loaded successfully")
+                
+                # Bind a concrete function for fixed-size frames to skip tf.function dispatch
+                try:
+                    self._infer = self.model.__call__.get_concrete_function(
+                        tf.TensorSpec([YAMNET_FRAME_SAMPLES], tf.float32))
+                except Exception as e:
+                    logger.warning(f"Falling back to dynamic model calls: {str(e)}")
+                    self._infer = self.model
+            
+            # Load class names (cached on disk after the first download)
+            self.class_names = self._load_class_names()
             
             # Gunshot-related class indices and names in YAMNet
             self.gunshot_classes = [
@@ -38,39 +64,115 @@ class PretrainedGunshotDetector:
             gunshot_class_names = [self.class_names[i] for i in self.gunshot_classes]
             logger.info(f"Monitoring for classes: {gunshot_class_names}")
             
+            # Scratch space for abs() so peak detection doesn't allocate
+            self._abs_scratch = np.empty(int(44100 * 6), dtype=np.float32)
+            
         except Exception as e:
             logger.error(f"Error initializing model: {str(e)}")
             raise
+    
+    def _load_class_names(self):
+        """Load YAMNet class names, preferring local copies over a download."""
+        if os.path.exists(CLASS_MAP_CACHE):
+            class_map_path = CLASS_MAP_CACHE
+        elif self.model is not None:
+            # The TF-Hub model ships its own copy of the class map
+            class_map_path = self.model.class_map_path().numpy().decode('utf-8')
+        else:
+            logger.info("Downloading YAMNet class map...")
+            response = requests.get(CLASS_MAP_URL, timeout=30)
+            response.raise_for_status()
+            
+            # Write to a temporary file first so a partial download is never cached
+            os.makedirs(os.path.dirname(CLASS_MAP_CACHE), exist_ok=True)
+            tmp_path = f"{CLASS_MAP_CACHE}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+                f.write(response.text)
+            os.replace(tmp_path, CLASS_MAP_CACHE)
+            class_map_path = CLASS_MAP_CACHE
+        
+        with open(class_map_path, encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            next(reader)  # Skip header
+            return tuple(row[2] for row in reader)
+    
+    def _load_tflite(self, model_path):
+        """Load the quantized YAMNet model into a TFLite interpreter."""
+        self.interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=os.cpu_count())
+        
+        # The exported input is [None], which TFLite stores as [1]; fix it to one frame
+        input_index = self.interpreter.get_input_details()[0]['index']
+        self.interpreter.resize_tensor_input(input_index, [YAMNET_FRAME_SAMPLES], strict=True)
+        self.interpreter.allocate_tensors()
         
-    def process_audio(self, audio_data, sample_rate=44100):
-        """Process audio data for model input."""
+        self._input_details = self.interpreter.get_input_details()[0]
+        
+        # Outputs are scores, embeddings and spectrogram; pick scores by class count
+        self._scores_details = next(
+            details for details in self.interpreter.get_output_details()
+            if details['shape'][-1] == YAMNET_NUM_CLASSES
+        )
+        logger.info(f"Quantized YAMNet model loaded from {model_path}")
+    
+    def _run_model(self, frame):
+        """Run YAMNet on one frame and return the per-patch class scores."""
+        if self.interpreter is None:
+            scores, embeddings, spectrogram = self._infer(tf.constant(frame))
+            return scores.numpy()
+        
+        # Quantize the input if the model expects integer samples
+        input_details = self._input_details
+        if input_details['dtype'] != np.float32:
+            scale, zero_point = input_details['quantization']
+            limits = np.iinfo(input_details['dtype'])
+            frame = np.clip(np.round(frame / scale + zero_point), limits.min, limits.max)
+            frame = frame.astype(input_details['dtype'])
+        self.interpreter.set_tensor(input_details['index'], frame)
+        self.interpreter.invoke()
+        
+        scores = self.interpreter.get_tensor(self._scores_details['index'])
+        if scores.dtype != np.float32:
+            scale, zero_point = self._scores_details['quantization']
+            scores = (scores.astype(np.float32) - zero_point) * scale
+        return scores.reshape(-1, YAMNET_NUM_CLASSES)
+    
+    def _peak(self, audio_data):
+        """Return the peak absolute amplitude using the shared scratch buffer."""
+        if audio_data.size > self._abs_scratch.size:
+            self._abs_scratch = np.empty(audio_data.size, dtype=np.float32)
+        return np.abs(audio_data, out=self._abs_scratch[:audio_data.size]).max()
+        
+    def process_audio(self, audio_data, sample_rate=44100, peak=None):
+        """Process audio data for model input (peak may be passed if already known)."""
         try:
-            # Ensure the input is a numpy array
-            audio_data = np.array(audio_data)
-            
-            # Convert to float32 if not already
-            audio_data = audio_data.astype(np.float32)
+            # Ensure a float32 numpy array (no copy if it already is one)
+            audio_data = np.asarray(audio_data, dtype=np.float32)
             
-            # Reshape if needed
+            # Reshape if needed (a view for contiguous input)
             if len(audio_data.shape) == 2:
-                audio_data = audio_data.flatten()
+                audio_data = audio_data.reshape(-1)
             
-            # Normalize audio to [-1, 1] range
-            if np.max(np.abs(audio_data)) > 0:
-                audio_data = audio_data / np.max(np.abs(audio_data))
+            # Normalize audio to [-1, 1] range; a float32 scale keeps the result float32
+            # and writing to a new array leaves the caller's buffer untouched
+            if peak is None:
+                peak = self._peak(audio_data)
+            if peak > 0:
+                audio_data = audio_data * np.float32(1.0 / peak)
             
             logger.debug(f"Audio shape before resample: {audio_data.shape}, Sample rate: {sample_rate}")
             
-            # Resample to 16kHz for YAMNet
+            # Resample to 16kHz for YAMNet (44100 -> 16000 is up=160, down=441)
             if sample_rate != 16000:
-                audio_data = librosa.resample(
-                    y=audio_data,
-                    orig_sr=sample_rate,
-                    target_sr=16000
-                )
+                factor = math.gcd(16000, sample_rate)
+                up, down = 16000 // factor, sample_rate // factor
+                audio_data = resample_poly(
+                    audio_data, up, down,
+                    window=_resample_filter(up, down)
+                ).astype(np.float32, copy=False)
             
-            logger.debug(f"Processed audio shape: {audio_data.shape}")
-            logger.debug(f"Audio range: [{np.min(audio_data)}, {np.max(audio_data)}]")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Processed audio shape: {audio_data.shape}")
+                logger.debug(f"Audio range: [{np.min(audio_data)}, {np.max(audio_data)}]")
             
             return audio_data
             
@@ -81,12 +183,38 @@ class PretrainedGunshotDetector:
     def detect(self, audio_data, sample_rate=44100):
         """Detect gunshots in audio data."""
         try:
-            # Process audio
-            processed_audio = self.process_audio(audio_data, sample_rate)
+            # Skip inference entirely on quiet audio (checked before normalization)
+            audio_data = np.asarray(audio_data, dtype=np.float32).reshape(-1)
+            peak = self._peak(audio_data)
+            if peak < NOISE_FLOOR:
+                logger.debug(f"Peak {peak:.4f} below noise floor, skipping inference")
+                return 0.0
+            
+            # Process audio, reusing the peak from the noise gate
+            processed_audio = self.process_audio(audio_data, sample_rate, peak=peak)
+            
+            # Score frame by frame (50% overlap), keeping the highest probability
+            starts = list(range(0, max(processed_audio.size - YAMNET_FRAME_SAMPLES, 0) + 1,
+                                YAMNET_FRAME_SAMPLES // 2))
+            if starts[-1] + YAMNET_FRAME_SAMPLES < processed_audio.size:
+                starts.append(processed_audio.size - YAMNET_FRAME_SAMPLES)
+            return max(self.detect_stream(processed_audio[start:start + YAMNET_FRAME_SAMPLES])
+                       for start in starts)
+            
+        except Exception as e:
+            logger.error(f"Error during detection: {str(e)}")
+            return 0.0
+    
+    def detect_stream(self, frame_16k):
+        """Detect gunshots in a single frame already resampled to 16kHz."""
+        try:
+            # Pad or trim to exactly one YAMNet frame to match the concrete function
+            frame = np.zeros(YAMNET_FRAME_SAMPLES, dtype=np.float32)
+            n = min(frame_16k.size, YAMNET_FRAME_SAMPLES)
+            frame[:n] = frame_16k[:n]
             
             # Run inference
-            scores, embeddings, spectrogram = self.model(processed_audio)
-            scores = scores.numpy()
+            scores = self._run_model(frame)
             
             # Get probabilities for all classes
             all_probs = np.max(scores, axis=0)
@@ -99,16 +227,19 @@ class PretrainedGunshotDetector:
             max_gunshot_class = self.gunshot_classes[np.argmax(np.max(gunshot_probs, axis=0))]
             
             # Find the top 5 detected classes for debugging
-            top_5_indices = np.argsort(all_probs)[-5:][::-1]
-            
-            logger.info("\nTop 5 detected sounds:")
-            for idx in top_5_indices:
-                if idx < len(self.class_names):  # Ensure index is valid
-                    logger.info(f"{self.class_names[idx]}: {all_probs[idx]:.3f}")
-            
-            if max_gunshot_prob > 0:
-                logger.info(f"Detected gunshot type: {self.class_names[max_gunshot_class]}")
-            logger.info(f"Gunshot probability: {max_gunshot_prob:.3f}")
+            top_5_indices = np.argpartition(all_probs, -5)[-5:]
+            top_5_indices = top_5_indices[np.argsort(all_probs[top_5_indices])[::-1]]
+            
+            # Runs on every window, so keep this at DEBUG
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("\nTop 5 detected sounds:")
+                for idx in top_5_indices:
+                    if idx < len(self.class_names):  # Ensure index is valid
+                        logger.debug(f"{self.class_names[idx]}: {all_probs[idx]:.3f}")
+                
+                if max_gunshot_prob > 0:
+                    logger.debug(f"Detected gunshot type: {self.class_names[max_gunshot_class]}")
+                logger.debug(f"Gunshot probability: {max_gunshot_prob:.3f}")
             
             return max_gunshot_prob
             
@@ -0,0 +1,86 @@
+# quantize_yamnet.py
+import tensorflow as tf
+import tensorflow_hub as hub
+import numpy as np
+import soundfile as sf
+from scipy.signal import resample_poly
+import argparse
+import glob
+import logging
+import math
+import os
+from pretrained_detector import TFLITE_MODEL_PATH, YAMNET_FRAME_SAMPLES
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def load_calibration_frames(wav_dir, max_frames=200):
+    """Load 16kHz YAMNet-sized frames from WAV files for calibration."""
+    frames = []
+    for path in sorted(glob.glob(os.path.join(wav_dir, "*.wav"))):
+        audio, sample_rate = sf.read(path, dtype='float32', always_2d=True)
+        audio = audio[:, 0]
+        if sample_rate != 16000:
+            factor = math.gcd(16000, sample_rate)
+            audio = resample_poly(audio, 16000 // factor, sample_rate // factor).astype(np.float32)
+
+        for start in range(0, audio.size - YAMNET_FRAME_SAMPLES + 1, YAMNET_FRAME_SAMPLES):
+            frames.append(audio[start:start + YAMNET_FRAME_SAMPLES])
+            if len(frames) >= max_frames:
+                return frames
+    return frames
+
+def synthetic_frames(count=100):
+    """Generate noise frames at a range of levels when no recordings are available."""
+    rng = np.random.default_rng(0)
+    levels = np.logspace(-3, 0, count)
+    return [(rng.standard_normal(YAMNET_FRAME_SAMPLES) * level).clip(-1, 1).astype(np.float32)
+            for level in levels]
+
+def quantize(output_path, wav_dir=None):
+    """Convert YAMNet to a TFLite model with int8 weights and activations."""
+    logger.info("Loading YAMNet model...")
+    model = hub.load('https://tfhub.dev/google/yamnet/1')
+    concrete_func = model.__call__.get_concrete_function(
+        tf.TensorSpec([YAMNET_FRAME_SAMPLES], tf.float32))
+
+    frames = load_calibration_frames(wav_dir) if wav_dir else []
+    if not frames:
+        logger.warning("No calibration recordings found, using synthetic noise")
+        frames = synthetic_frames()
+    logger.info(f"Calibrating with {len(frames)} frames")
+
+    def representative_dataset():
+        for frame in frames:
+            yield [frame]
+
+    converter = tf.lite.TFLiteConverter.from_concrete_functions([concrete_func], model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    # The log-mel frontend (STFT) has no int8 kernels, so allow float fallback for it
+    converter.target_spec.supported_ops = [
+        tf.lite.OpsSet.TFLITE_BUILTINS_INT8,
+        tf.lite.OpsSet.TFLITE_BUILTINS,
+    ]
+    tflite_model = converter.convert()
+
+    with open(output_path, 'wb') as f:
+        f.write(tflite_model)
+    logger.info(f"Quantized model saved to: {output_path} ({len(tflite_model) / 1e6:.1f} MB)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize YAMNet to an int8 TFLite model.")
+    parser.add_argument("--calibration-dir", default="recordings",
+                        help="Directory of WAV files used for calibration")
+    parser.add_argument("--output", default=TFLITE_MODEL_PATH,
+                        help="Where to write the .tflite model")
+    args = parser.parse_args()
+
+    quantize(args.output, args.calibration_dir)
+
+if __name__ == "__main__":
+    main()